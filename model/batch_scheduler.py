@@ -0,0 +1,199 @@
+import asyncio
+import functools
+import logging
+import numpy as np
+from typing import Any, Callable, List
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+class BatchScheduler:
+    def __init__(
+        self,
+        process_batch: Callable[..., List[Any]],
+        tokenizer=None,
+        max_batch: int = 32,
+        max_wait_ms: float = 8,
+        max_length_ratio: float = 1.3,
+        max_buckets: int = 3,
+        min_bucket_size: int = 8
+    ):
+        """
+        Coalesce concurrent requests into batched model calls
+
+        Args:
+            process_batch (callable): Function taking a list of texts (plus keyword
+                parameters) and returning one result per text, in order
+            tokenizer: Tokenizer used to measure input lengths (falls back to character counts)
+            max_batch (int): Maximum number of requests per forward pass
+            max_wait_ms (float): How long to wait for more requests once one arrives
+            max_length_ratio (float): Longest/shortest token count above which a sub-batch is split
+            max_buckets (int): Maximum number of sub-batches per batch
+            min_bucket_size (int): Smallest sub-batch worth its own forward pass
+        """
+        self.process_batch = process_batch
+        self.tokenizer = tokenizer
+        self.max_batch = max_batch
+        self.max_wait = max_wait_ms / 1000
+        self.max_length_ratio = max_length_ratio
+        self.max_buckets = max_buckets
+        self.min_bucket_size = min_bucket_size
+        self.queue = None
+        self.worker = None
+
+    def _ensure_worker(self):
+        """Start the background drain task on the running event loop"""
+        if self.worker is None or self.worker.done():
+            self.queue = asyncio.Queue()
+            self.worker = asyncio.get_running_loop().create_task(self._run())
+
+    async def submit(self, text: str, **params):
+        """
+        Queue a text for batched processing
+
+        Args:
+            text (str): Input text
+            **params: Keyword parameters for process_batch; only requests with
+                identical parameters are batched together
+
+        Returns:
+            Result of process_batch for this text
+        """
+        self._ensure_worker()
+        future = asyncio.get_running_loop().create_future()
+        await self.queue.put((text, params, future))
+        return await future
+
+    async def _collect(self):
+        """Wait for one request, then gather more until the batch is full or the window closes"""
+        items = [await self.queue.get()]
+        deadline = asyncio.get_running_loop().time() + self.max_wait
+        while len(items) < self.max_batch:
+            timeout = deadline - asyncio.get_running_loop().time()
+            if timeout <= 0:
+                break
+            try:
+                items.append(await asyncio.wait_for(self.queue.get(), timeout))
+            except asyncio.TimeoutError:
+                break
+        return items
+
+    async def _run(self):
+        """Background task: drain the queue forever"""
+        while True:
+            items = await self._collect()
+            await self.drain(items)
+
+    async def drain(self, items):
+        """
+        Run the collected requests through the model and resolve their futures
+
+        Args:
+            items (list): (text, params, future) tuples
+        """
+        groups = {}
+        for item in items:
+            key = tuple(sorted(item[1].items()))
+            groups.setdefault(key, []).append(item)
+
+        loop = asyncio.get_running_loop()
+        for group in groups.values():
+            texts = [text for text, _, _ in group]
+            params = group[0][1]
+            try:
+                # Run the forward passes off the event loop so new requests keep queuing
+                results = await loop.run_in_executor(None, functools.partial(self._process_bucketed, texts, params))
+            except Exception as e:
+                logger.error("Error processing batch of %s: %s", len(texts), e)
+                if len(group) == 1:
+                    self._resolve(group[0][2], exception=e)
+                else:
+                    # Retry one at a time so only the offending request fails
+                    await self._drain_singly(group)
+                continue
+
+            for (_, _, future), result in zip(group, results):
+                self._resolve(future, result=result)
+
+    async def _drain_singly(self, group):
+        """
+        Process each request of a failed batch on its own
+
+        Args:
+            group (list): (text, params, future) tuples sharing the same params
+        """
+        loop = asyncio.get_running_loop()
+        for text, params, future in group:
+            try:
+                results = await loop.run_in_executor(None, functools.partial(self.process_batch, [text], **params))
+            except Exception as e:
+                logger.error("Error processing request: %s", e)
+                self._resolve(future, exception=e)
+            else:
+                self._resolve(future, result=results[0])
+
+    @staticmethod
+    def _resolve(future, result=None, exception=None):
+        """Complete a request's future unless its caller has already gone away"""
+        if future.done():
+            return
+        if exception is not None:
+            future.set_exception(exception)
+        else:
+            future.set_result(result)
+
+    def _length_buckets(self, texts):
+        """
+        Sort texts by length and split them into sub-batches of similar length
+
+        Each extra forward pass costs about as much as the padding it saves, so
+        a batch is split into at most max_buckets sub-batches of at least
+        min_bucket_size texts each.
+
+        Args:
+            texts (list): Input texts
+
+        Returns:
+            list: Index arrays into texts, shortest inputs first
+        """
+        if len(texts) < 2 * self.min_bucket_size:
+            return [np.arange(len(texts))]
+
+        if self.tokenizer is not None:
+            input_ids = self.tokenizer(texts, add_special_tokens=True, padding=False)["input_ids"]
+            lengths = np.array([len(ids) for ids in input_ids])
+        else:
+            lengths = np.array([len(text) for text in texts])
+
+        order = np.argsort(lengths, kind="stable")
+        # Start a new bucket once the current one is big enough and the length exceeds the ratio to its shortest input
+        splits, bucket_start = [], 0
+        for position in range(len(order)):
+            if (
+                len(splits) < self.max_buckets - 1
+                and position - bucket_start >= self.min_bucket_size
+                and len(order) - position >= self.min_bucket_size
+                and lengths[order[position]] > lengths[order[bucket_start]] * self.max_length_ratio
+            ):
+                splits.append(position)
+                bucket_start = position
+        return np.split(order, splits)
+
+    def _process_bucketed(self, texts, params):
+        """
+        Run process_batch once per length bucket and restore the request order
+
+        Args:
+            texts (list): Input texts
+            params (dict): Keyword parameters for process_batch
+
+        Returns:
+            list: One result per text, in the order of texts
+        """
+        results = [None] * len(texts)
+        for bucket in self._length_buckets(texts):
+            bucket_results = self.process_batch([texts[index] for index in bucket], **params)
+            for index, result in zip(bucket.tolist(), bucket_results):
+                results[index] = result
+        return results
@@ -1,5 +1,10 @@
-from transformers import AutoTokenizer, AutoModelForTokenClassification, pipeline
+from transformers import AutoTokenizer, AutoModelForTokenClassification
+import contextlib
+import numpy as np
+import threading
+import torch
 import logging
+from model_utils import WARMUP_SEQ_LENGTHS, compile_enabled, compile_model, get_backend, load_onnx_model, load_torch_model
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
@@ -9,23 +14,67 @@ class BiomedicalNER:
     def __init__(self):
         """Initialize the biomedical NER model"""
         self.model_name = "d4data/biomedical-ner-all"
+        self.backend = get_backend("NER_BACKEND")
         self.tokenizer = None
         self.model = None
-        self.nlp = None
+        self.tags = None
+        self._input_ids = None
+        self._attention_mask = None
+        self._buffer_lock = threading.Lock()
         self.load_model()
     
     def load_model(self):
         """Load the pre-trained NER model for biomedical diseases"""
         try:
-            logger.info(f"Loading model: {self.model_name}")
-            self.tokenizer = AutoTokenizer.from_pretrained(self.model_name)
-            self.model = AutoModelForTokenClassification.from_pretrained(self.model_name)
-            self.nlp = pipeline("ner", model=self.model, tokenizer=self.tokenizer, aggregation_strategy="simple")
+            logger.info("Loading model: %s (%s backend)", self.model_name, self.backend)
+            self.tokenizer = AutoTokenizer.from_pretrained(self.model_name, use_fast=True)
+            if not self.tokenizer.is_fast:
+                raise ValueError(f"No fast (Rust) tokenizer available for {self.model_name}")
+            if self.backend == "onnx":
+                from optimum.onnxruntime import ORTModelForTokenClassification
+                self.model = load_onnx_model(ORTModelForTokenClassification, self.model_name)
+            else:
+                self.model = load_torch_model(AutoModelForTokenClassification, self.model_name)
+                self.model.eval()
+                if compile_enabled():
+                    self.model = compile_model(self.model)
+                    self._warmup()
+            
+            # (BIO prefix, entity group) per label id, used to merge token predictions into entities
+            id2label = self.model.config.id2label
+            self.tags = [self._split_tag(id2label[label_id]) for label_id in range(len(id2label))]
             logger.info("Model loaded successfully!")
         except Exception as e:
-            logger.error(f"Error loading model: {str(e)}")
+            logger.error("Error loading model: %s", e)
             raise e
     
+    def allocate_input_buffers(self, max_batch: int):
+        """
+        Preallocate fixed-size GPU input tensors (no-op on CPU)
+        
+        Batches are copied into a slice of these buffers instead of allocating
+        fresh device tensors per request, which avoids allocator churn and
+        fragmentation under high concurrency. The buffers are flat so that the
+        prefix viewed as (batch, seq_len) stays contiguous and the model does
+        not copy it again. Larger batches fall back to regular device copies.
+        
+        Args:
+            max_batch (int): Largest batch the caller will submit
+        """
+        if self.model.device.type != "cuda":
+            return
+        
+        max_seq = min(self.tokenizer.model_max_length, self.model.config.max_position_embeddings)
+        self._input_ids = torch.zeros(max_batch * max_seq, dtype=torch.long, device=self.model.device)
+        self._attention_mask = torch.zeros(max_batch * max_seq, dtype=torch.long, device=self.model.device)
+    
+    def _warmup(self):
+        """Run dummy forward passes so compiled graphs are built before serving traffic"""
+        with torch.inference_mode():
+            for seq_len in WARMUP_SEQ_LENGTHS:
+                input_ids = torch.ones((1, seq_len), dtype=torch.long, device=self.model.device)
+                self.model(input_ids=input_ids, attention_mask=torch.ones_like(input_ids))
+    
     def extract_entities(self, text: str):
         """
         Extract named entities from biomedical text
@@ -36,44 +85,149 @@ class BiomedicalNER:
         Returns:
             list: List of extracted entities with their labels and confidence scores
         """
+        return self.extract_entities_batch([text])[0]
+    
+    def extract_entities_batch(self, texts: list):
+        """
+        Extract named entities from several texts in a single batched forward pass
+        
+        Args:
+            texts (list): Input biomedical texts
+            
+        Returns:
+            list: One list of extracted entities per input text
+        """
         try:
-            if not self.nlp:
+            if self.model is None:
                 raise ValueError("Model not loaded properly")
             
-            # Run the NER
-            results = self.nlp(text)
+            # Tokenize the whole batch once; offsets map tokens back to character spans
+            encodings = self.tokenizer(
+                texts,
+                padding=True,
+                truncation=True,
+                return_offsets_mapping=True,
+                return_tensors="pt"
+            )
+            offset_mapping = encodings.pop("offset_mapping").numpy()
             
-            # Format results
-            entities = []
-            for entity in results:
-                entities.append({
-                    "word": entity['word'],
-                    "entity_group": entity['entity_group'],
-                    "score": round(entity['score'], 2),
-                    "start": entity.get('start', 0),
-                    "end": entity.get('end', 0)
-                })
-            
-            return entities
+            return self.extract_entities_from_ids(
+                texts,
+                encodings["input_ids"],
+                encodings["attention_mask"],
+                offset_mapping
+            )
         except Exception as e:
-            logger.error(f"Error extracting entities: {str(e)}")
+            logger.error("Error extracting entities: %s", e)
             raise e
     
-    def print_entities(self, text: str):
+    def extract_entities_from_ids(self, texts: list, input_ids, attention_mask, offset_mapping):
         """
-        Print named entities in a formatted way
+        Extract named entities from already tokenized texts
+        
+        Lets callers that have tokenized the input with this model's tokenizer
+        skip a second tokenization pass.
         
         Args:
-            text (str): Input biomedical text
+            texts (list): Original input texts
+            input_ids (torch.Tensor): (batch, seq_len) token ids
+            attention_mask (torch.Tensor): (batch, seq_len) attention mask
+            offset_mapping (np.ndarray): (batch, seq_len, 2) character offsets per token
+            
+        Returns:
+            list: One list of extracted entities per input text
+        """
+        batch_size, seq_len = input_ids.shape
+        use_buffers = self._input_ids is not None and batch_size * seq_len <= self._input_ids.numel()
+        
+        with self._buffer_lock if use_buffers else contextlib.nullcontext():
+            if use_buffers:
+                # Copy into contiguous views of the preallocated buffers
+                device_input_ids = self._input_ids[:batch_size * seq_len].view(batch_size, seq_len)
+                device_attention_mask = self._attention_mask[:batch_size * seq_len].view(batch_size, seq_len)
+                device_input_ids.copy_(input_ids)
+                device_attention_mask.copy_(attention_mask)
+            else:
+                device_input_ids = input_ids.to(self.model.device)
+                device_attention_mask = attention_mask.to(self.model.device)
+            
+            # Run the NER and reduce to the best label per token on the model's device
+            with torch.inference_mode():
+                logits = self.model(input_ids=device_input_ids, attention_mask=device_attention_mask).logits
+                scores, label_ids = logits.softmax(-1).max(-1)
+            scores = scores.float().cpu().numpy()
+            label_ids = label_ids.cpu().numpy()
+        
+        # Format results
+        return [
+            self._to_records(text, *self._group_entities(offset_mapping[i], label_ids[i], scores[i]))
+            for i, text in enumerate(texts)
+        ]
+    
+    @staticmethod
+    def _split_tag(label: str):
+        """Split a label such as "B-Disease_disorder" into ("B", "Disease_disorder")"""
+        if label.startswith("B-") or label.startswith("I-"):
+            return label[0], label[2:]
+        return "I", label
+    
+    def _group_entities(self, offsets, label_ids, scores):
         """
-        entities = self.extract_entities(text)
+        Merge per-token predictions into entity spans
         
-        print(f"\nInput text: {text}")
-        print("\nNamed Entities:")
-        for entity in entities:
-            print(f"{entity['word']} -> {entity['entity_group']} (score: {entity['score']:.2f})")
+        Follows the "simple" aggregation strategy of the transformers NER pipeline:
+        consecutive tokens of the same entity group are merged unless a B- tag
+        starts a new entity, and each entity scores the mean of its token scores.
         
-        return entities
+        Args:
+            offsets (np.ndarray): (seq_len, 2) character offsets per token
+            label_ids (np.ndarray): Best label id per token
+            scores (np.ndarray): Probability of the best label per token
+            
+        Returns:
+            tuple: Entity groups, start offsets, end offsets and scores as arrays
+        """
+        groups, starts, ends, score_sums, counts = [], [], [], [], []
+        for (start, end), label_id, score in zip(offsets.tolist(), label_ids.tolist(), scores.tolist()):
+            # Special and padding tokens map to an empty character span
+            if start == end:
+                continue
+            
+            bio, group = self.tags[label_id]
+            if groups and group == groups[-1] and bio != "B":
+                ends[-1] = end
+                score_sums[-1] += score
+                counts[-1] += 1
+            else:
+                groups.append(group)
+                starts.append(start)
+                ends.append(end)
+                score_sums.append(score)
+                counts.append(1)
+        
+        groups = np.asarray(groups, dtype=object)
+        keep = groups != "O"
+        return (
+            groups[keep],
+            np.asarray(starts, dtype=np.int64)[keep],
+            np.asarray(ends, dtype=np.int64)[keep],
+            (np.asarray(score_sums, dtype=np.float64) / np.asarray(counts, dtype=np.float64))[keep]
+        )
+    
+    @staticmethod
+    def _to_records(text: str, groups, starts, ends, scores):
+        """Build the JSON-ready entity dicts from the structure-of-arrays result"""
+        return [
+            {
+                "word": text[start:end],
+                "entity_group": group,
+                "score": score,
+                "start": start,
+                "end": end
+            }
+            # Round all scores in one vectorized op instead of per entity
+            for group, start, end, score in zip(groups.tolist(), starts.tolist(), ends.tolist(), np.round(scores, 2).tolist())
+        ]
 
 # Example usage
 if __name__ == "__main__":
@@ -84,4 +238,9 @@ if __name__ == "__main__":
     text = "Patients suffering from diabetes and Alzheimer's disease are at risk."
     
     # Extract and print entities
-    ner_model.print_entities(text) 
\ No newline at end of file
+    entities = ner_model.extract_entities(text)
+    
+    print(f"\nInput text: {text}")
+    print("\nNamed Entities:")
+    for entity in entities:
+        print(f"{entity['word']} -> {entity['entity_group']} (score: {entity['score']:.2f})") 
\ No newline at end of file
@@ -0,0 +1,22 @@
+from uvicorn.workers import UvicornWorker
+from server_config import LIMIT_CONCURRENCY, TORCH_THREADS
+import torch
+
+class ServerWorker(UvicornWorker):
+    """
+    Uvicorn worker for gunicorn with the same event loop, HTTP parser and
+    concurrency limit as `python3 server.py` (gunicorn's --worker-connections
+    is ignored by UvicornWorker)
+    """
+    CONFIG_KWARGS = {
+        "loop": "uvloop",
+        "http": "httptools",
+        "limit_concurrency": LIMIT_CONCURRENCY
+    }
+
+    def load_wsgi(self):
+        """Load the app, then size this worker's thread pool after the fork"""
+        super().load_wsgi()
+        # server.py loads the models single-threaded under gunicorn, since with --preload
+        # the master's OpenMP thread pool would not survive the fork into this worker
+        torch.set_num_threads(TORCH_THREADS)
@@ -0,0 +1,246 @@
+import contextlib
+import os
+import shutil
+import tempfile
+import logging
+import torch
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Directory where exported and optimized ONNX graphs are cached between restarts
+ONNX_CACHE_DIR = os.environ.get("ONNX_CACHE_DIR", "./onnx_cache")
+
+# Directory where CTranslate2 conversions are cached between restarts
+CT2_CACHE_DIR = os.environ.get("CT2_CACHE_DIR", "./ct2_cache")
+
+def get_backend(env_var: str, choices=("torch", "onnx")) -> str:
+    """
+    Read the inference backend for a model from the environment
+
+    Args:
+        env_var (str): Name of the environment variable to read
+        choices (tuple): Supported backend names
+
+    Returns:
+        str: Selected backend (defaults to "torch")
+    """
+    backend = os.environ.get(env_var, "torch").strip().lower()
+    if backend not in choices:
+        raise ValueError(f"Unsupported {env_var}={backend!r}, expected one of {', '.join(choices)}")
+    return backend
+
+def quantization_enabled() -> bool:
+    """Whether models should be quantized to INT8 (QUANTIZE_INT8=1)"""
+    return os.environ.get("QUANTIZE_INT8", "0") == "1"
+
+def get_torch_device():
+    """
+    Pick the device and dtype for PyTorch inference
+
+    Returns:
+        tuple: (torch.device, dtype) - FP16 on CUDA, FP32 on CPU
+    """
+    if torch.cuda.is_available():
+        return torch.device("cuda"), torch.float16
+    return torch.device("cpu"), torch.float32
+
+def load_torch_model(auto_model_class, model_name: str):
+    """
+    Load a PyTorch model onto the inference device
+
+    Models run in FP16 on CUDA and FP32 on CPU. With QUANTIZE_INT8=1 the weights
+    are instead loaded in 8-bit with bitsandbytes on CUDA, or the linear layers
+    are converted with PyTorch dynamic quantization on CPU.
+
+    Args:
+        auto_model_class: transformers auto class (e.g. AutoModelForTokenClassification)
+        model_name (str): HuggingFace model identifier
+
+    Returns:
+        PreTrainedModel: Loaded model
+    """
+    device, dtype = get_torch_device()
+
+    if quantization_enabled():
+        if device.type == "cuda":
+            logger.info("Loading %s in 8-bit with bitsandbytes", model_name)
+            return auto_model_class.from_pretrained(model_name, load_in_8bit=True, device_map="auto")
+
+        logger.info("Applying INT8 dynamic quantization to %s", model_name)
+        model = auto_model_class.from_pretrained(model_name)
+        return torch.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+
+    logger.info("Loading %s on %s (%s)", model_name, device, dtype)
+    return auto_model_class.from_pretrained(model_name, torch_dtype=dtype).to(device)
+
+@contextlib.contextmanager
+def staging_dir(target_dir: str):
+    """
+    Build a cache directory in a private temporary directory and move it into place
+
+    Several workers can start on a cold cache at once, so each writes to its own
+    temporary directory next to target_dir. An interrupted build is never picked
+    up as a valid cache, and if another worker publishes target_dir first its
+    (equivalent) copy is kept and this one discarded.
+
+    Args:
+        target_dir (str): Final cache directory
+
+    Yields:
+        str: Temporary directory to write into
+    """
+    parent_dir = os.path.dirname(target_dir) or "."
+    os.makedirs(parent_dir, exist_ok=True)
+    tmp_dir = tempfile.mkdtemp(dir=parent_dir, prefix=os.path.basename(target_dir) + ".tmp-")
+    try:
+        yield tmp_dir
+        try:
+            os.replace(tmp_dir, target_dir)
+        except OSError:
+            if not os.path.isdir(target_dir):
+                raise
+            logger.info("%s was already built by another process", target_dir)
+    finally:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+
+def get_onnx_provider() -> str:
+    """Pick the fastest ONNX Runtime execution provider available on this machine"""
+    import onnxruntime
+
+    if "CUDAExecutionProvider" in onnxruntime.get_available_providers():
+        return "CUDAExecutionProvider"
+    if torch.cuda.is_available():
+        logger.warning(
+            "CUDA is available but ONNX Runtime has no CUDAExecutionProvider; "
+            "install requirements-gpu.txt (onnxruntime-gpu) to run the ONNX backend on the GPU in FP16"
+        )
+    return "CPUExecutionProvider"
+
+def load_onnx_model(ort_model_class, model_name: str):
+    """
+    Load an ONNX Runtime version of a HuggingFace checkpoint
+
+    On first use the checkpoint is exported to ONNX, optimized with the
+    transformer graph fusions (Attention, SkipLayerNorm, FastGelu) and, on
+    CUDA, converted to FP16. On CPU with QUANTIZE_INT8=1 the weights are then
+    dynamically quantized to INT8. The results are cached under ONNX_CACHE_DIR
+    so later startups skip the export.
+
+    Args:
+        ort_model_class: optimum.onnxruntime model class (e.g. ORTModelForTokenClassification)
+        model_name (str): HuggingFace model identifier
+
+    Returns:
+        ORTModel: Optimized model bound to the selected execution provider
+    """
+    from optimum.onnxruntime import ORTOptimizer
+    from optimum.onnxruntime.configuration import OptimizationConfig
+
+    provider = get_onnx_provider()
+    use_fp16 = provider == "CUDAExecutionProvider"
+    cache_dir = os.path.join(ONNX_CACHE_DIR, model_name.replace("/", "__") + ("-fp16" if use_fp16 else ""))
+
+    if not os.path.isdir(cache_dir):
+        logger.info("Exporting %s to ONNX (cache: %s)", model_name, cache_dir)
+        model = ort_model_class.from_pretrained(model_name, export=True)
+        optimizer = ORTOptimizer.from_pretrained(model)
+        optimization_config = OptimizationConfig(
+            optimization_level=2,
+            optimize_for_gpu=use_fp16,
+            fp16=use_fp16
+        )
+        with staging_dir(cache_dir) as tmp_dir:
+            optimizer.optimize(save_dir=tmp_dir, optimization_config=optimization_config)
+
+    if quantization_enabled():
+        if use_fp16:
+            logger.info("QUANTIZE_INT8 ignored for ONNX on CUDA, using the FP16 graph")
+        else:
+            cache_dir = quantize_onnx_dir(cache_dir)
+
+    logger.info("Loading ONNX model from %s (%s)", cache_dir, provider)
+    return ort_model_class.from_pretrained(cache_dir, provider=provider)
+
+def quantize_onnx_dir(src_dir: str) -> str:
+    """
+    Dynamically quantize every ONNX graph in a directory to INT8
+
+    Args:
+        src_dir (str): Directory holding the optimized ONNX model
+
+    Returns:
+        str: Directory holding the quantized copy (cached next to src_dir)
+    """
+    from onnxruntime.quantization import QuantType, quantize_dynamic
+
+    dst_dir = src_dir + "-int8"
+    if not os.path.isdir(dst_dir):
+        logger.info("Quantizing ONNX model in %s to INT8", src_dir)
+        with staging_dir(dst_dir) as tmp_dir:
+            for file_name in os.listdir(src_dir):
+                src_path = os.path.join(src_dir, file_name)
+                dst_path = os.path.join(tmp_dir, file_name)
+                if file_name.endswith(".onnx"):
+                    quantize_dynamic(src_path, dst_path, weight_type=QuantType.QInt8)
+                else:
+                    shutil.copy(src_path, dst_path)
+    return dst_dir
+
+def load_ctranslate2_translator(model_name: str):
+    """
+    Load a CTranslate2 translator for an encoder-decoder HuggingFace checkpoint
+
+    The checkpoint is converted on first use (int8_float16 on CUDA, int8 on CPU)
+    and cached under CT2_CACHE_DIR.
+
+    Args:
+        model_name (str): HuggingFace model identifier
+
+    Returns:
+        ctranslate2.Translator: Translator bound to the selected device
+    """
+    import ctranslate2
+
+    device = "cuda" if ctranslate2.get_cuda_device_count() > 0 else "cpu"
+    quantization = "int8_float16" if device == "cuda" else "int8"
+    output_dir = os.path.join(CT2_CACHE_DIR, model_name.replace("/", "__") + "-" + quantization)
+
+    if not os.path.isdir(output_dir):
+        logger.info("Converting %s to CTranslate2 (%s, cache: %s)", model_name, quantization, output_dir)
+        with staging_dir(output_dir) as tmp_dir:
+            ctranslate2.converters.TransformersConverter(model_name).convert(tmp_dir, quantization=quantization, force=True)
+
+    logger.info("Loading CTranslate2 model from %s (%s)", output_dir, device)
+    return ctranslate2.Translator(output_dir, device=device)
+
+# Representative input lengths used to prime compiled graphs at startup
+WARMUP_SEQ_LENGTHS = (64, 256)
+
+def compile_enabled() -> bool:
+    """Whether torch.compile should be applied (USE_COMPILE=1 and torch >= 2.0)"""
+    if os.environ.get("USE_COMPILE", "0") != "1":
+        return False
+    if int(torch.__version__.split(".")[0]) < 2:
+        logger.warning("USE_COMPILE=1 ignored: torch.compile needs torch >= 2.0 (found %s)", torch.__version__)
+        return False
+    return True
+
+def compile_model(model):
+    """
+    Compile a model's forward pass with torch.compile
+
+    The forward method is compiled in place rather than wrapping the module, so
+    attributes like config and generate() keep working and generate() runs the
+    compiled forward on every decoding step.
+
+    Args:
+        model: PyTorch model to compile
+
+    Returns:
+        The same model with a compiled forward
+    """
+    logger.info("Compiling %s with torch.compile", type(model).__name__)
+    model.forward = torch.compile(model.forward, mode="reduce-overhead", fullgraph=False)
+    return model
@@ -0,0 +1,111 @@
+import hashlib
+import logging
+import psutil
+from cachetools import LRUCache
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# (limit, usage, stat) files for cgroup v2 and v1 memory controllers
+CGROUP_MEMORY_FILES = (
+    ("/sys/fs/cgroup/memory.max", "/sys/fs/cgroup/memory.current", "/sys/fs/cgroup/memory.stat", "inactive_file"),
+    (
+        "/sys/fs/cgroup/memory/memory.limit_in_bytes",
+        "/sys/fs/cgroup/memory/memory.usage_in_bytes",
+        "/sys/fs/cgroup/memory/memory.stat",
+        "total_inactive_file"
+    )
+)
+
+def _read_cgroup_memory_percent():
+    """
+    Memory usage of this container as a percentage of its cgroup limit
+
+    Reclaimable page cache (inactive_file) is not counted, matching the
+    working set the OOM killer and kubelet act on.
+
+    Returns:
+        float: Usage percent, or None when no cgroup memory limit applies
+    """
+    host_total = psutil.virtual_memory().total
+    for limit_path, usage_path, stat_path, inactive_key in CGROUP_MEMORY_FILES:
+        try:
+            with open(limit_path) as f:
+                limit = f.read().strip()
+            # cgroup v2 reports "max" and v1 a huge number when unlimited
+            if limit == "max" or int(limit) >= host_total:
+                return None
+            with open(usage_path) as f:
+                usage = int(f.read())
+            with open(stat_path) as f:
+                for line in f:
+                    key, value = line.split()
+                    if key == inactive_key:
+                        usage -= int(value)
+                        break
+            return 100.0 * max(usage, 0) / int(limit)
+        except (OSError, ValueError):
+            continue
+    return None
+
+def memory_usage_percent() -> float:
+    """Memory usage (percent) of the container limit when running under one, else of the host"""
+    percent = _read_cgroup_memory_percent()
+    if percent is None:
+        percent = psutil.virtual_memory().percent
+    return percent
+
+class ResponseCache:
+    def __init__(self, maxsize: int = 1024, memory_high_watermark: float = 90.0, memory_check_interval: int = 64):
+        """
+        In-process LRU cache for model results keyed by a hash of the input
+
+        Args:
+            maxsize (int): Maximum number of cached results
+            memory_high_watermark (float): Memory usage (percent of the container
+                limit, or of system memory outside a container) above which the
+                cache is emptied instead of growing
+            memory_check_interval (int): Number of stores between memory checks
+        """
+        self.cache = LRUCache(maxsize=maxsize)
+        self.memory_high_watermark = memory_high_watermark
+        self.memory_check_interval = memory_check_interval
+        self.puts_since_check = 0
+
+    @staticmethod
+    def make_key(text: str, *params):
+        """
+        Build a cache key from the input text and any generation parameters
+
+        Args:
+            text (str): Input text
+            *params: Parameters that change the result
+
+        Returns:
+            tuple: BLAKE2b digest of the text followed by the parameters
+        """
+        return (hashlib.blake2b(text.encode()).digest(),) + params
+
+    def get(self, key):
+        """Return the cached result for key, or None"""
+        return self.cache.get(key)
+
+    def put(self, key, value):
+        """
+        Store a result, dropping everything cached first if memory is running low
+
+        Memory is only checked every memory_check_interval stores, since reading
+        it on every cache miss costs more than the check protects against.
+
+        Args:
+            key (tuple): Key from make_key
+            value: Result to cache
+        """
+        self.puts_since_check += 1
+        if self.cache and self.puts_since_check >= self.memory_check_interval:
+            self.puts_since_check = 0
+            if memory_usage_percent() >= self.memory_high_watermark:
+                logger.warning("Memory usage above %s%%, clearing %s cached responses", self.memory_high_watermark, len(self.cache))
+                self.cache.clear()
+        self.cache[key] = value
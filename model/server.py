@@ -1,20 +1,43 @@
-from fastapi import FastAPI, HTTPException
+from fastapi import Depends, FastAPI, HTTPException, Response
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import ORJSONResponse
 from pydantic import BaseModel
 from typing import List, Dict, Any, Optional
+import asyncio
+import functools
 import logging
+import orjson
+import os
+import sys
+import torch
 from biomedical_ner import BiomedicalNER
 from biomedical_summarizer import BiomedicalSummarizer
+from batch_scheduler import BatchScheduler
+from response_cache import ResponseCache
+from server_config import TORCH_THREADS, WORKERS
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+def configure_torch_runtime(num_threads: int):
+    """
+    Set the per-process torch threading and allocator options before any model loads
+    
+    Args:
+        num_threads (int): Intra-op threads to use while loading the models
+    """
+    torch.set_num_threads(num_threads)
+    torch.set_num_interop_threads(1)
+    # Let the CUDA caching allocator grow segments instead of fragmenting on variable-size activations
+    os.environ.setdefault("PYTORCH_CUDA_ALLOC_CONF", "expandable_segments:True")
+
 # Initialize FastAPI app
 app = FastAPI(
     title="Biomedical NER & Summarization API",
     description="API for biomedical Named Entity Recognition and Text Summarization using transformer models",
-    version="1.0.0"
+    version="1.0.0",
+    default_response_class=ORJSONResponse
 )
 
 # Add CORS middleware
@@ -26,10 +49,6 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# Initialize the models
-ner_model = None
-summarizer_model = None
-
 # Pydantic models for request/response
 class TextInput(BaseModel):
     text: str
@@ -61,49 +80,128 @@ class SummarizationResponse(BaseModel):
     max_length: int
     min_length: int
 
-@app.on_event("startup")
-async def startup_event():
-    """Initialize the models on startup"""
-    global ner_model, summarizer_model
-    try:
-        logger.info("Initializing biomedical NER model...")
-        ner_model = BiomedicalNER()
-        logger.info("NER model initialized successfully!")
-        
-        logger.info("Initializing biomedical summarization model...")
-        summarizer_model = BiomedicalSummarizer()
-        logger.info("Summarization model initialized successfully!")
-        
-        logger.info("All models loaded successfully!")
-    except Exception as e:
-        logger.error(f"Failed to initialize models: {str(e)}")
-        raise e
+@functools.lru_cache(maxsize=1)
+def get_ner() -> BiomedicalNER:
+    """Load the biomedical NER model once per process"""
+    logger.info("Initializing biomedical NER model...")
+    ner_model = BiomedicalNER()
+    logger.info("NER model initialized successfully!")
+    return ner_model
+
+@functools.lru_cache(maxsize=1)
+def get_summarizer() -> BiomedicalSummarizer:
+    """Load the biomedical summarization model once per process"""
+    logger.info("Initializing biomedical summarization model...")
+    summarizer_model = BiomedicalSummarizer()
+    logger.info("Summarization model initialized successfully!")
+    return summarizer_model
+
+@functools.lru_cache(maxsize=1)
+def get_ner_scheduler() -> BatchScheduler:
+    """Micro-batcher that coalesces concurrent NER requests into one forward pass"""
+    ner_model = get_ner()
+    scheduler = BatchScheduler(ner_model.extract_entities_batch, tokenizer=ner_model.tokenizer)
+    ner_model.allocate_input_buffers(scheduler.max_batch)
+    return scheduler
+
+@functools.lru_cache(maxsize=1)
+def get_summarizer_scheduler() -> BatchScheduler:
+    """Micro-batcher that coalesces concurrent summarization requests into one generate call"""
+    summarizer_model = get_summarizer()
+    return BatchScheduler(summarizer_model.summarize_batch, tokenizer=summarizer_model.tokenizer)
+
+# Dependencies are async so FastAPI resolves them on the event loop instead of a threadpool
+# hop per request. They only hand out the schedulers built at import time and never load
+# a model themselves, which would block the event loop for every other request
+async def ner_scheduler_dependency() -> BatchScheduler:
+    """NER micro-batcher for the request handlers"""
+    if get_ner_scheduler.cache_info().currsize == 0:
+        raise HTTPException(status_code=503, detail="NER model is not loaded")
+    return get_ner_scheduler()
+
+async def summarizer_scheduler_dependency() -> BatchScheduler:
+    """Summarization micro-batcher for the request handlers"""
+    if get_summarizer_scheduler.cache_info().currsize == 0:
+        raise HTTPException(status_code=503, detail="Summarization model is not loaded")
+    return get_summarizer_scheduler()
+
+# Load the models and build their schedulers at import time. With `gunicorn --preload`
+# this happens once in the master process and the forked workers share the weight pages
+# copy-on-write. The `python server.py` launcher only supervises: uvicorn imports the app
+# in each worker, and spawned workers first re-run the launcher script as `__mp_main__`,
+# so both script names skip the load while any import name (`server`, `model.server`) runs it.
+# Under gunicorn the models load single-threaded: libgomp's thread pool is not fork-safe, so a
+# --preload master must never start one. gunicorn_worker.ServerWorker applies TORCH_THREADS in
+# each worker after the fork
+if __name__ not in ("__main__", "__mp_main__"):
+    configure_torch_runtime(1 if "gunicorn" in sys.modules else TORCH_THREADS)
+    get_ner_scheduler()
+    get_summarizer_scheduler()
+    logger.info("All models loaded successfully!")
+
+# The root and health payloads only change when the models load, so serialize them once
+# here instead of per request (liveness probes hit /health constantly)
+ROOT_RESPONSE = orjson.dumps({
+    "message": "Biomedical NER & Summarization API", 
+    "status": "active",
+    "models": {
+        "ner": "d4data/biomedical-ner-all",
+        "summarization": "facebook/bart-large-cnn"
+    }
+})
+HEALTH_RESPONSE = orjson.dumps({
+    "status": "healthy",
+    "models_loaded": {
+        "ner": get_ner.cache_info().currsize > 0,
+        "summarizer": get_summarizer.cache_info().currsize > 0
+    }
+})
+
+# Results for recently seen inputs, so re-submitting the same abstract skips the models
+RESPONSE_CACHE_SIZE = int(os.environ.get("RESPONSE_CACHE_SIZE", 1024))
+ner_cache = ResponseCache(maxsize=RESPONSE_CACHE_SIZE)
+summary_cache = ResponseCache(maxsize=RESPONSE_CACHE_SIZE)
+
+async def extract_entities_cached(ner_scheduler: BatchScheduler, text: str):
+    """Extract entities, serving repeated inputs from the response cache"""
+    key = ResponseCache.make_key(text)
+    entities = ner_cache.get(key)
+    if entities is None:
+        entities = await ner_scheduler.submit(text)
+        ner_cache.put(key, entities)
+    return entities
+
+async def summarize_cached(
+    summarizer_scheduler: BatchScheduler,
+    text: str,
+    max_length: int = 60,
+    min_length: int = 20,
+    do_sample: bool = False
+):
+    """Summarize text, serving repeated deterministic requests from the response cache"""
+    # Sampled summaries are expected to differ between calls
+    if do_sample:
+        return await summarizer_scheduler.submit(text, max_length=max_length, min_length=min_length, do_sample=do_sample)
+    
+    key = ResponseCache.make_key(text, max_length, min_length)
+    result = summary_cache.get(key)
+    if result is None:
+        result = await summarizer_scheduler.submit(text, max_length=max_length, min_length=min_length, do_sample=do_sample)
+        summary_cache.put(key, result)
+    return result
 
 @app.get("/")
 async def root():
     """Root endpoint"""
-    return {
-        "message": "Biomedical NER & Summarization API", 
-        "status": "active",
-        "models": {
-            "ner": "d4data/biomedical-ner-all",
-            "summarization": "facebook/bart-large-cnn"
-        }
-    }
+    return Response(content=ROOT_RESPONSE, media_type="application/json")
 
 @app.get("/health")
 async def health_check():
     """Health check endpoint"""
-    return {
-        "status": "healthy",
-        "models_loaded": {
-            "ner": ner_model is not None,
-            "summarizer": summarizer_model is not None
-        }
-    }
+    return Response(content=HEALTH_RESPONSE, media_type="application/json")
 
 @app.post("/extract-entities", response_model=NERResponse)
-async def extract_entities(input_data: TextInput):
+async def extract_entities(input_data: TextInput, ner_scheduler: BatchScheduler = Depends(ner_scheduler_dependency)):
     """
     Extract biomedical entities from text
     
@@ -114,41 +212,28 @@ async def extract_entities(input_data: TextInput):
         NERResponse: Extracted entities with metadata
     """
     try:
-        if not ner_model:
-            raise HTTPException(status_code=503, detail="Model not loaded")
-        
         if not input_data.text.strip():
             raise HTTPException(status_code=400, detail="Text input cannot be empty")
         
         # Extract entities
-        entities = ner_model.extract_entities(input_data.text)
+        entities = await extract_entities_cached(ner_scheduler, input_data.text)
         
-        # Format response
-        entity_responses = [
-            EntityResponse(
-                word=entity["word"],
-                entity_group=entity["entity_group"],
-                score=entity["score"],
-                start=entity["start"],
-                end=entity["end"]
-            )
-            for entity in entities
-        ]
-        
-        return NERResponse(
-            input_text=input_data.text,
-            entities=entity_responses,
-            total_entities=len(entity_responses)
-        )
+        # Entities come from our own model code, so return them as-is instead of
+        # re-validating every field; response_model still documents the schema
+        return ORJSONResponse({
+            "input_text": input_data.text,
+            "entities": entities,
+            "total_entities": len(entities)
+        })
         
     except HTTPException:
         raise
     except Exception as e:
-        logger.error(f"Error processing request: {str(e)}")
+        logger.error("Error processing request: %s", e)
         raise HTTPException(status_code=500, detail=f"Internal server error: {str(e)}")
 
 @app.post("/analyze")
-async def analyze_text(input_data: TextInput):
+async def analyze_text(input_data: TextInput, ner_scheduler: BatchScheduler = Depends(ner_scheduler_dependency)):
     """
     Simplified endpoint for text analysis
     
@@ -159,25 +244,25 @@ async def analyze_text(input_data: TextInput):
         dict: Simple response with entities
     """
     try:
-        if not ner_model:
-            raise HTTPException(status_code=503, detail="Model not loaded")
-        
-        entities = ner_model.extract_entities(input_data.text)
+        entities = await extract_entities_cached(ner_scheduler, input_data.text)
         
-        return {
+        return ORJSONResponse({
             "text": input_data.text,
             "entities": entities,
             "count": len(entities)
-        }
+        })
         
     except HTTPException:
         raise
     except Exception as e:
-        logger.error(f"Error in analysis: {str(e)}")
+        logger.error("Error in analysis: %s", e)
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.post("/summarize", response_model=SummarizationResponse)
-async def summarize_text(input_data: SummarizationInput):
+async def summarize_text(
+    input_data: SummarizationInput,
+    summarizer_scheduler: BatchScheduler = Depends(summarizer_scheduler_dependency)
+):
     """
     Summarize biomedical text
     
@@ -188,30 +273,31 @@ async def summarize_text(input_data: SummarizationInput):
         SummarizationResponse: Summary with metadata
     """
     try:
-        if not summarizer_model:
-            raise HTTPException(status_code=503, detail="Summarization model not loaded")
-        
         if not input_data.text.strip():
             raise HTTPException(status_code=400, detail="Text input cannot be empty")
         
         # Generate summary
-        result = summarizer_model.summarize_text(
-            text=input_data.text,
+        result = await summarize_cached(
+            summarizer_scheduler,
+            input_data.text,
             max_length=input_data.max_length,
             min_length=input_data.min_length,
             do_sample=input_data.do_sample
         )
         
-        return SummarizationResponse(**result)
+        return ORJSONResponse(result)
         
     except HTTPException:
         raise
     except Exception as e:
-        logger.error(f"Error processing summarization request: {str(e)}")
+        logger.error("Error processing summarization request: %s", e)
         raise HTTPException(status_code=500, detail=f"Internal server error: {str(e)}")
 
 @app.post("/summarize-simple")
-async def summarize_simple(input_data: TextInput):
+async def summarize_simple(
+    input_data: TextInput,
+    summarizer_scheduler: BatchScheduler = Depends(summarizer_scheduler_dependency)
+):
     """
     Simple summarization endpoint with default parameters
     
@@ -222,28 +308,29 @@ async def summarize_simple(input_data: TextInput):
         dict: Simple response with summary
     """
     try:
-        if not summarizer_model:
-            raise HTTPException(status_code=503, detail="Summarization model not loaded")
-        
         if not input_data.text.strip():
             raise HTTPException(status_code=400, detail="Text input cannot be empty")
         
-        result = summarizer_model.summarize_text(input_data.text)
+        result = await summarize_cached(summarizer_scheduler, input_data.text)
         
-        return {
+        return ORJSONResponse({
             "original_text": result["original_text"],
             "summary": result["summary"],
             "compression_ratio": result["compression_ratio"]
-        }
+        })
         
     except HTTPException:
         raise
     except Exception as e:
-        logger.error(f"Error in simple summarization: {str(e)}")
+        logger.error("Error in simple summarization: %s", e)
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.post("/extract-and-summarize")
-async def extract_and_summarize(input_data: SummarizationInput):
+async def extract_and_summarize(
+    input_data: SummarizationInput,
+    ner_scheduler: BatchScheduler = Depends(ner_scheduler_dependency),
+    summarizer_scheduler: BatchScheduler = Depends(summarizer_scheduler_dependency)
+):
     """
     Combined endpoint: Extract entities and summarize text
     
@@ -254,24 +341,23 @@ async def extract_and_summarize(input_data: SummarizationInput):
         dict: Combined response with entities and summary
     """
     try:
-        if not ner_model or not summarizer_model:
-            raise HTTPException(status_code=503, detail="One or more models not loaded")
-        
         if not input_data.text.strip():
             raise HTTPException(status_code=400, detail="Text input cannot be empty")
         
-        # Extract entities
-        entities = ner_model.extract_entities(input_data.text)
-        
-        # Generate summary
-        summary_result = summarizer_model.summarize_text(
-            text=input_data.text,
-            max_length=input_data.max_length,
-            min_length=input_data.min_length,
-            do_sample=input_data.do_sample
+        # Extract entities and generate the summary concurrently; each model
+        # runs in its own executor thread so NER overlaps with decoding
+        entities, summary_result = await asyncio.gather(
+            extract_entities_cached(ner_scheduler, input_data.text),
+            summarize_cached(
+                summarizer_scheduler,
+                input_data.text,
+                max_length=input_data.max_length,
+                min_length=input_data.min_length,
+                do_sample=input_data.do_sample
+            )
         )
         
-        return {
+        return ORJSONResponse({
             "original_text": input_data.text,
             "summary": summary_result["summary"],
             "entities": entities,
@@ -279,14 +365,24 @@ async def extract_and_summarize(input_data: SummarizationInput):
             "compression_ratio": summary_result["compression_ratio"],
             "original_length": summary_result["original_length"],
             "summary_length": summary_result["summary_length"]
-        }
+        })
         
     except HTTPException:
         raise
     except Exception as e:
-        logger.error(f"Error in combined processing: {str(e)}")
+        logger.error("Error in combined processing: %s", e)
         raise HTTPException(status_code=500, detail=str(e))
 
 if __name__ == "__main__":
     import uvicorn
-    uvicorn.run(app, host="0.0.0.0", port=8000) 
\ No newline at end of file
+    from server_config import LIMIT_CONCURRENCY
+    uvicorn.run(
+        "server:app",
+        host="0.0.0.0",
+        port=8000,
+        workers=WORKERS,
+        loop="uvloop",
+        http="httptools",
+        log_level="warning",
+        limit_concurrency=LIMIT_CONCURRENCY
+    ) 
\ No newline at end of file
@@ -0,0 +1,13 @@
+# Launcher settings shared by `python3 server.py` and the gunicorn worker class. Kept out of
+# server.py so reading them does not load the models, and out of gunicorn_worker.py so the
+# plain uvicorn launcher does not need gunicorn installed
+import os
+
+# Requests each worker serves at once before shedding load with 503s instead of queueing forever
+LIMIT_CONCURRENCY = 64
+
+# Number of server worker processes
+WORKERS = int(os.environ.get("WORKERS", 1))
+
+# Intra-op threads per worker, sized so concurrent workers don't oversubscribe the cores
+TORCH_THREADS = int(os.environ.get("TORCH_THREADS", max(1, (os.cpu_count() or 1) // WORKERS)))
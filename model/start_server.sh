@@ -54,10 +54,25 @@ if [ $? -ne 0 ]; then
     exit 1
 fi
 
+# The CPU and CUDA builds of ONNX Runtime install the same module files, so swap one for the
+# other. On a re-run the CPU build was just reinstalled over the GPU build's files and uninstalling
+# it deletes them, so force-reinstall the GPU packages to restore them
+if python3 -c "import sys, torch; sys.exit(0 if torch.cuda.is_available() else 1)"; then
+    echo -e "${YELLOW}CUDA available: installing the GPU build of ONNX Runtime...${NC}"
+    pip uninstall -y onnxruntime \
+        && pip install -r requirements-gpu.txt \
+        && pip install --force-reinstall --no-deps -r requirements-gpu.txt
+
+    if [ $? -ne 0 ]; then
+        echo -e "${RED}Failed to install GPU requirements${NC}"
+        exit 1
+    fi
+fi
+
 echo -e "${GREEN}All dependencies installed successfully!${NC}"
 
 # Download models (this will happen automatically on first run)
-echo -e "${YELLOW}Note: Both NER and summarization models will be downloaded automatically on first API calls${NC}"
+echo -e "${YELLOW}Note: Both NER and summarization models will be downloaded automatically when the server starts${NC}"
 
 # Start the server
 echo -e "${BLUE}Starting FastAPI server...${NC}"
@@ -65,4 +80,32 @@ echo -e "${YELLOW}Server will be available at: http://localhost:8000${NC}"
 echo -e "${YELLOW}API docs will be available at: http://localhost:8000/docs${NC}"
 echo -e "${YELLOW}Press Ctrl+C to stop the server${NC}"
 
-python3 server.py 
\ No newline at end of file
+# Keep the OpenMP/MKL thread count fixed
+export MKL_DYNAMIC=FALSE
+
+# Pin threads to physical cores only with a single worker: every worker gets the same place
+# list, so with several workers binding would stack them all on the first cores
+if [ "${WORKERS:-1}" -eq 1 ]; then
+    export OMP_PROC_BIND=close
+    export OMP_PLACES=cores
+fi
+
+# Reduce CUDA allocator fragmentation from variable-size activations
+export PYTORCH_CUDA_ALLOC_CONF=expandable_segments:True
+
+# On CPU the models are loaded once in the master process (--preload) and shared with the
+# workers. CUDA cannot be used in a child forked after it was initialized, so on GPU
+# machines each worker loads its own copy of the models instead
+PRELOAD="--preload"
+if python3 -c "import sys, torch; sys.exit(0 if torch.cuda.is_available() else 1)"; then
+    echo -e "${YELLOW}CUDA available: loading the models in each worker${NC}"
+    PRELOAD=""
+fi
+
+gunicorn server:app \
+    $PRELOAD \
+    --workers "${WORKERS:-1}" \
+    --worker-class gunicorn_worker.ServerWorker \
+    --log-level warning \
+    --bind 0.0.0.0:8000 \
+    --timeout 300
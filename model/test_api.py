@@ -3,32 +3,34 @@
 Test script for the Biomedical NER & Summarization API
 """
 
-import requests
-import json
-import time
+import asyncio
+import httpx
 import sys
 
 # API base URL
 BASE_URL = "http://localhost:8000"
 
-def test_health_endpoint():
+# Per-request timeout in seconds
+TIMEOUT = 30
+
+async def check_health_endpoint(client: httpx.AsyncClient):
     """Test the health check endpoint"""
     try:
-        response = requests.get(f"{BASE_URL}/health")
+        response = await client.get("/health")
         if response.status_code == 200:
             print("✅ Health check passed")
             return True
         else:
             print(f"❌ Health check failed: {response.status_code}")
             return False
-    except requests.exceptions.ConnectionError:
+    except httpx.ConnectError:
         print("❌ Cannot connect to server. Is it running?")
         return False
 
-def test_root_endpoint():
+async def check_root_endpoint(client: httpx.AsyncClient):
     """Test the root endpoint"""
     try:
-        response = requests.get(f"{BASE_URL}/")
+        response = await client.get("/")
         if response.status_code == 200:
             data = response.json()
             print(f"✅ Root endpoint: {data['message']}")
@@ -40,14 +42,14 @@ def test_root_endpoint():
         print(f"❌ Root endpoint error: {e}")
         return False
 
-def test_extract_entities():
+async def check_extract_entities(client: httpx.AsyncClient):
     """Test the extract entities endpoint"""
     test_text = "Patients suffering from diabetes and Alzheimer's disease are at risk. The doctor prescribed metformin for blood sugar control."
     
     payload = {"text": test_text}
     
     try:
-        response = requests.post(f"{BASE_URL}/extract-entities", json=payload)
+        response = await client.post("/extract-entities", json=payload)
         
         if response.status_code == 200:
             data = response.json()
@@ -67,14 +69,14 @@ def test_extract_entities():
         print(f"❌ Extract entities error: {e}")
         return False
 
-def test_analyze_endpoint():
+async def check_analyze_endpoint(client: httpx.AsyncClient):
     """Test the simple analyze endpoint"""
     test_text = "Patient has hypertension and chronic metformin medication."
     
     payload = {"text": test_text}
     
     try:
-        response = requests.post(f"{BASE_URL}/analyze", json=payload)
+        response = await client.post("/analyze", json=payload)
         
         if response.status_code == 200:
             data = response.json()
@@ -92,7 +94,7 @@ def test_analyze_endpoint():
         print(f"❌ Analyze endpoint error: {e}")
         return False
 
-def test_summarization_endpoint():
+async def check_summarization_endpoint(client: httpx.AsyncClient):
     """Test the summarization endpoint"""
     test_text = """
     Chronic obstructive pulmonary disease (COPD) is a common, preventable, and treatable disease characterized by persistent respiratory symptoms and airflow limitation 
@@ -110,7 +112,7 @@ def test_summarization_endpoint():
     }
     
     try:
-        response = requests.post(f"{BASE_URL}/summarize", json=payload)
+        response = await client.post("/summarize", json=payload)
         
         if response.status_code == 200:
             data = response.json()
@@ -129,7 +131,7 @@ def test_summarization_endpoint():
         print(f"❌ Summarization endpoint error: {e}")
         return False
 
-def test_combined_endpoint():
+async def check_combined_endpoint(client: httpx.AsyncClient):
     """Test the combined extract and summarize endpoint"""
     test_text = "Patients with diabetes and hypertension require careful monitoring. COPD is a chronic condition that affects breathing."
     
@@ -140,7 +142,7 @@ def test_combined_endpoint():
     }
     
     try:
-        response = requests.post(f"{BASE_URL}/extract-and-summarize", json=payload)
+        response = await client.post("/extract-and-summarize", json=payload)
         
         if response.status_code == 200:
             data = response.json()
@@ -157,30 +159,40 @@ def test_combined_endpoint():
         print(f"❌ Combined endpoint error: {e}")
         return False
 
-def main():
+async def main():
     """Run all tests"""
     print("🧪 Testing Biomedical NER & Summarization API")
     print("=" * 50)
     
     # Wait a moment for server to be ready
     print("Waiting for server to be ready...")
-    time.sleep(2)
+    await asyncio.sleep(2)
     
     tests = [
-        ("Health Check", test_health_endpoint),
-        ("Root Endpoint", test_root_endpoint),
-        ("Extract Entities", test_extract_entities),
-        ("Analyze Endpoint", test_analyze_endpoint),
-        ("Summarization Endpoint", test_summarization_endpoint),
-        ("Combined Endpoint", test_combined_endpoint)
+        ("Root Endpoint", check_root_endpoint),
+        ("Extract Entities", check_extract_entities),
+        ("Analyze Endpoint", check_analyze_endpoint),
+        ("Summarization Endpoint", check_summarization_endpoint),
+        ("Combined Endpoint", check_combined_endpoint)
     ]
     
-    passed = 0
-    total = len(tests)
+    total = len(tests) + 1
+    
+    async with httpx.AsyncClient(base_url=BASE_URL, timeout=TIMEOUT) as client:
+        print("\n🔍 Testing Health Check...")
+        if not await check_health_endpoint(client):
+            print("❌ Health Check failed")
+            print("\n" + "=" * 50)
+            print(f"📊 Results: 0/{total} tests passed")
+            return 1
+        
+        # Run the remaining tests concurrently; this also exercises the server under parallel load
+        print(f"\n🔍 Running {len(tests)} tests concurrently...")
+        results = await asyncio.gather(*[test_func(client) for _, test_func in tests])
     
-    for test_name, test_func in tests:
-        print(f"\n🔍 Testing {test_name}...")
-        if test_func():
+    passed = 1
+    for (test_name, _), result in zip(tests, results):
+        if result:
             passed += 1
         else:
             print(f"❌ {test_name} failed")
@@ -196,4 +208,4 @@ def main():
         return 1
 
 if __name__ == "__main__":
-    sys.exit(main()) 
\ No newline at end of file
+    sys.exit(asyncio.run(main())) 
\ No newline at end of file